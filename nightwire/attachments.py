@@ -1,10 +1,15 @@
 """Attachment handling for Signal bot - download, validate, and save image attachments."""
 
+import asyncio
+import functools
+import os
 import re
-import uuid
-from datetime import datetime
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Optional
+from types import MappingProxyType
+from typing import List, Mapping, Optional, Tuple
 
 import aiohttp
 import structlog
@@ -13,102 +18,254 @@ logger = structlog.get_logger()
 
 # Supported image MIME types for Claude vision
 MAX_ATTACHMENT_SIZE = 50_000_000  # 50MB
+DOWNLOAD_CHUNK_SIZE = 256 * 1024  # bytes per streamed read
+MAX_CONCURRENT_DOWNLOADS = 8  # per message
 
-SUPPORTED_IMAGE_TYPES: Dict[str, str] = {
+# Saved files are written straight to an fd (no BufferedWriter copy) and are
+# readable only by the bot user
+_WRITE_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+_FILE_MODE = 0o600
+_WRITE_SLICE_SIZE = 1 << 20  # 1 MiB
+
+# Signal attachment IDs are immutable, so a re-delivered message can reuse the
+# file saved the first time instead of downloading it again
+_SAVED_ATTACHMENTS: "OrderedDict[Tuple[Path, str], Path]" = OrderedDict()
+_SAVED_ATTACHMENTS_MAX = 256
+
+# Safe ID characters only, and no '..' anywhere (path traversal)
+_ATTACHMENT_ID_RE = re.compile(r'(?!.*\.\.)[a-zA-Z0-9_=.\-]+')
+_NON_DIGIT_RE = re.compile(r'[^\d]')
+# Deletes every ASCII non-digit; str.translate strips them in a single C pass
+_ASCII_NON_DIGITS = str.maketrans('', '', ''.join(
+    chr(c) for c in range(128) if not chr(c).isdigit()
+))
+
+# Read-only so the MIME allowlist can't be widened at runtime
+SUPPORTED_IMAGE_TYPES: Mapping[str, str] = MappingProxyType({
     "image/jpeg": ".jpg",
     "image/png": ".png",
     "image/gif": ".gif",
     "image/webp": ".webp",
-}
+})
 
 
-async def download_attachment(
+def _attachment_url(signal_api_url: str, attachment_id: str) -> Optional[str]:
+    """Build the download URL, or return None if the attachment ID is unsafe."""
+    # Validate attachment_id to prevent SSRF/path traversal
+    # Signal API returns IDs with file extensions (e.g., "09GIqaSf01wyBX0zokr7.jpg")
+    att_str = str(attachment_id)
+    if not _ATTACHMENT_ID_RE.fullmatch(att_str):
+        logger.warning("invalid_attachment_id", attachment_id=att_str[:20])
+        return None
+    return f"{signal_api_url}/v1/attachments/{attachment_id}"
+
+
+async def download_attachment_to_file(
     session: aiohttp.ClientSession,
     signal_api_url: str,
     attachment_id: str,
-) -> Optional[bytes]:
-    """Download an attachment from Signal API.
+    dest: Path,
+) -> bool:
+    """Stream an attachment from Signal API straight to disk.
+
+    The body is written chunk by chunk to a temporary ``.part`` file next to
+    dest and renamed into place once complete, so memory use stays at one
+    chunk regardless of attachment size. File I/O runs in a worker thread so
+    a slow disk never blocks the event loop.
 
     Args:
         session: aiohttp session for HTTP requests
         signal_api_url: Base URL of the Signal API
         attachment_id: The Signal attachment ID
+        dest: Final path for the attachment
 
     Returns:
-        Attachment bytes or None if download fails
+        True if the attachment was saved to dest
     """
-    # Validate attachment_id to prevent SSRF/path traversal
-    # Signal API returns IDs with file extensions (e.g., "09GIqaSf01wyBX0zokr7.jpg")
-    att_str = str(attachment_id)
-    if not re.match(r'^[a-zA-Z0-9_=.\-]+$', att_str) or '..' in att_str:
-        logger.warning("invalid_attachment_id", attachment_id=att_str[:20])
-        return None
+    url = _attachment_url(signal_api_url, attachment_id)
+    if url is None:
+        return False
 
+    part = _PartFile(dest.with_name(dest.name + ".part"))
+    saved = False
     try:
-        url = f"{signal_api_url}/v1/attachments/{attachment_id}"
         async with session.get(url) as resp:
-            if resp.status == 200:
-                # Stream response in chunks to enforce size limit regardless of headers
-                chunks = []
-                total = 0
-                async for chunk in resp.content.iter_chunked(8192):
-                    total += len(chunk)
-                    if total > MAX_ATTACHMENT_SIZE:
-                        logger.warning("attachment_too_large_streaming", attachment_id=attachment_id)
-                        return None
-                    chunks.append(chunk)
-                data = b"".join(chunks)
-                logger.info("attachment_downloaded", id=attachment_id, size=len(data))
-                return data
-            else:
+            if resp.status != 200:
                 logger.error("attachment_download_failed", id=attachment_id, status=resp.status)
-                return None
+                return False
+            total = 0
+            await part.open()
+            async for chunk in resp.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                total += len(chunk)
+                if total > MAX_ATTACHMENT_SIZE:
+                    logger.warning("attachment_too_large_streaming", attachment_id=attachment_id)
+                    break
+                await part.write(chunk)
+        if total > MAX_ATTACHMENT_SIZE or total == 0:
+            return False
+        await part.commit(dest)
+        saved = True
+        logger.info("attachment_saved", path=str(dest), size=total)
+        return True
     except aiohttp.ClientError as e:
         logger.error("attachment_download_error", id=attachment_id, error=str(e), error_type=type(e).__name__)
-        return None
+        return False
+    except OSError as e:
+        logger.error("attachment_save_error", path=str(dest), error=str(e), error_type=type(e).__name__)
+        return False
+    finally:
+        # Also runs on cancellation (e.g. shutdown mid-download). discard is
+        # queued behind any in-flight open/write, so it always sees their fd.
+        if not saved:
+            await part.discard()
+        part.shutdown()
 
 
-def save_attachment(
-    attachment_data: bytes,
-    content_type: str,
-    sender: str,
-    attachments_dir: Path,
-) -> Optional[Path]:
-    """Save attachment data to disk.
+class _PartFile:
+    """Temporary download file whose I/O runs in order on one worker thread.
 
-    Args:
-        attachment_data: Raw attachment bytes
-        content_type: MIME type of the attachment
-        sender: Phone number of sender (for organizing files)
-        attachments_dir: Base directory for attachments
-
-    Returns:
-        Path to saved file or None if unsupported type
+    Every operation is queued on a single-thread executor, so a cleanup
+    requested after a cancelled open or write runs only once that call
+    has finished in its thread: the fd it produced is closed and the file
+    removed instead of leaking.
     """
-    if content_type not in SUPPORTED_IMAGE_TYPES:
-        logger.warning("unsupported_attachment_type", content_type=content_type)
-        return None
 
-    ext = SUPPORTED_IMAGE_TYPES[content_type]
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    unique_id = uuid.uuid4().hex[:8]
+    def __init__(self, path: Path):
+        self.path = path
+        self._fd: Optional[int] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    async def _run(self, func, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="attachment_io"
+            )
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def open(self) -> None:
+        await self._run(self._open)
+
+    async def write(self, data: bytes) -> None:
+        await self._run(self._write, data)
+
+    async def commit(self, dest: Path) -> None:
+        """Close the file and rename it to dest."""
+        await self._run(self._commit, dest)
+
+    async def discard(self) -> None:
+        """Close the file (if open) and remove it."""
+        if self._executor is not None:  # nothing was ever opened otherwise
+            await self._run(self._discard)
+
+    def shutdown(self) -> None:
+        # Queued work still runs; this only stops accepting new work
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    def _open(self) -> None:
+        self._fd = _open_for_write(self.path)
+
+    def _write(self, data: bytes) -> None:
+        _write_all(self._fd, data)
+
+    def _close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _commit(self, dest: Path) -> None:
+        self._close()
+        os.replace(self.path, dest)
+
+    def _discard(self) -> None:
+        self._close()
+        self.path.unlink(missing_ok=True)
+
+
+def _write_all(fd: int, data: bytes) -> None:
+    """Write data to an unbuffered fd in bounded slices, handling short writes."""
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view[:_WRITE_SLICE_SIZE])
+        view = view[written:]
+
+
+def _sender_digits(sender: str) -> str:
+    """Return only the digits of sender, for use as a directory name."""
+    if sender.isascii():
+        return sender.translate(_ASCII_NON_DIGITS)
+    return _NON_DIGIT_RE.sub('', sender)
+
+
+def _attachment_path(ext: str, sender: str, attachments_dir: Path) -> Path:
+    """Return a fresh file path in the sender's directory."""
+    timestamp = time.strftime("%Y%m%d_%H%M%S")
+    unique_id = os.urandom(4).hex()
     filename = f"{timestamp}_{unique_id}{ext}"
 
-    safe_sender = re.sub(r'[^\d]', '', sender)
+    return _sender_dir(attachments_dir, sender) / filename
+
+
+@functools.lru_cache(maxsize=1024)
+def _sender_dir(attachments_dir: Path, sender: str) -> Path:
+    """Return (creating once) the digits-only directory for a sender."""
+    safe_sender = _sender_digits(sender)
     if not safe_sender:
         safe_sender = "unknown"
     user_dir = attachments_dir / safe_sender
     user_dir.mkdir(parents=True, exist_ok=True)
+    return user_dir
 
-    file_path = user_dir / filename
+
+def _open_for_write(path: Path) -> int:
+    """Open path for writing, recreating its directory if it was removed."""
     try:
-        file_path.write_bytes(attachment_data)
-        logger.info("attachment_saved", path=str(file_path), size=len(attachment_data))
-        return file_path
-    except OSError as e:
-        logger.error("attachment_save_error", path=str(file_path), error=str(e), error_type=type(e).__name__)
+        return os.open(path, _WRITE_FLAGS, _FILE_MODE)
+    except FileNotFoundError:
+        # _sender_dir is cached, so the directory may have been deleted since
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return os.open(path, _WRITE_FLAGS, _FILE_MODE)
+
+
+async def _fetch_and_save(
+    attachment: dict,
+    sender: str,
+    session: aiohttp.ClientSession,
+    signal_api_url: str,
+    attachments_dir: Path,
+    semaphore: asyncio.Semaphore,
+) -> Optional[Path]:
+    """Download and save a single image attachment, or return None if skipped."""
+    content_type = attachment.get("contentType", "")
+    attachment_id = attachment.get("id")
+
+    ext = SUPPORTED_IMAGE_TYPES.get(content_type)
+    if ext is None:
+        logger.debug("skipping_non_image_attachment", content_type=content_type)
         return None
 
+    if not attachment_id:
+        logger.warning("attachment_missing_id", attachment=attachment)
+        return None
+
+    cache_key = (attachments_dir, attachment_id)
+    cached = _SAVED_ATTACHMENTS.get(cache_key)
+    if cached is not None and cached.exists():
+        logger.debug("attachment_cache_hit", id=attachment_id)
+        return cached
+
+    async with semaphore:
+        # Directory creation runs in a worker thread so it doesn't stall the event loop
+        file_path = await asyncio.to_thread(_attachment_path, ext, sender, attachments_dir)
+        if not await download_attachment_to_file(session, signal_api_url, attachment_id, file_path):
+            return None
+
+    _SAVED_ATTACHMENTS[cache_key] = file_path
+    while len(_SAVED_ATTACHMENTS) > _SAVED_ATTACHMENTS_MAX:
+        _SAVED_ATTACHMENTS.popitem(last=False)
+    return file_path
+
 
 async def process_attachments(
     attachments: List[dict],
@@ -119,6 +276,10 @@ async def process_attachments(
 ) -> List[Path]:
     """Process and save image attachments from a message.
 
+    Attachments are downloaded and saved concurrently (at most
+    MAX_CONCURRENT_DOWNLOADS at a time); the returned paths keep the order
+    of the input list. A failure in one attachment does not drop the others.
+
     Args:
         attachments: List of attachment dicts from Signal API
         sender: Phone number of sender
@@ -129,26 +290,17 @@ async def process_attachments(
     Returns:
         List of paths to saved image files
     """
-    saved_images = []
-
-    for attachment in attachments:
-        content_type = attachment.get("contentType", "")
-        attachment_id = attachment.get("id")
-
-        if content_type not in SUPPORTED_IMAGE_TYPES:
-            logger.debug("skipping_non_image_attachment", content_type=content_type)
-            continue
-
-        if not attachment_id:
-            logger.warning("attachment_missing_id", attachment=attachment)
-            continue
-
-        data = await download_attachment(session, signal_api_url, attachment_id)
-        if not data:
-            continue
-
-        file_path = save_attachment(data, content_type, sender, attachments_dir)
-        if file_path:
-            saved_images.append(file_path)
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
+    results = await asyncio.gather(*(
+        _fetch_and_save(attachment, sender, session, signal_api_url, attachments_dir, semaphore)
+        for attachment in attachments
+    ), return_exceptions=True)
 
+    saved_images = []
+    for result in results:
+        if isinstance(result, BaseException):
+            logger.error("attachment_process_error", error=str(result),
+                         error_type=type(result).__name__)
+        elif result:
+            saved_images.append(result)
     return saved_images
@@ -30,6 +30,12 @@ from .prd_builder import clean_json_string, extract_balanced_json, parse_prd_jso
 
 logger = structlog.get_logger()
 
+# Connection pool sizing for the shared aiohttp session
+_HTTP_POOL_LIMIT = 100
+_HTTP_POOL_LIMIT_PER_HOST = 20
+_HTTP_KEEPALIVE_TIMEOUT = 75  # seconds
+_HTTP_DNS_CACHE_TTL = 300  # seconds
+
 
 def _log_task_exception(task: asyncio.Task):
     """Log exceptions from fire-and-forget tasks instead of silently swallowing them."""
@@ -133,7 +139,8 @@ class SignalBot:
         self.memory = MemoryManager(
             db_path=memory_db_path,
             session_timeout_minutes=self.config.memory_session_timeout,
-            max_context_tokens=self.config.memory_max_context_tokens
+            max_context_tokens=self.config.memory_max_context_tokens,
+            tokenizer=self.config.memory_tokenizer,
         )
         self.memory_commands = MemoryCommands(self.memory)
 
@@ -170,7 +177,16 @@ class SignalBot:
 
     async def start(self):
         """Start the bot."""
-        self.session = aiohttp.ClientSession()
+        # One long-lived session for Signal API calls and attachment downloads
+        # so keep-alive connections are pooled and reused across requests
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=_HTTP_POOL_LIMIT,
+                limit_per_host=_HTTP_POOL_LIMIT_PER_HOST,
+                keepalive_timeout=_HTTP_KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=_HTTP_DNS_CACHE_TTL,
+            )
+        )
         self.running = True
 
         # Warn if non-localhost Signal API is not using HTTPS
@@ -537,31 +553,36 @@ class SignalBot:
         if len(message) <= max_length:
             return [message]
 
+        # Walk with indices so each part is sliced once; re-slicing the
+        # remainder every iteration would copy the tail again per part
         parts = []
-        remaining = message
-
-        while remaining:
-            if len(remaining) <= max_length:
-                parts.append(remaining)
+        start = 0
+        length = len(message)
+        min_split = max_length // 2
+
+        while start < length:
+            end = start + max_length
+            if end >= length:
+                parts.append(message[start:])
                 break
 
             # Try to split at a paragraph boundary (double newline)
-            split_pos = remaining.rfind("\n\n", 0, max_length)
-            if split_pos > max_length // 2:
-                parts.append(remaining[:split_pos])
-                remaining = remaining[split_pos + 2:]
+            split_pos = message.rfind("\n\n", start, end)
+            if split_pos - start > min_split:
+                parts.append(message[start:split_pos])
+                start = split_pos + 2
                 continue
 
             # Try to split at a single newline
-            split_pos = remaining.rfind("\n", 0, max_length)
-            if split_pos > max_length // 2:
-                parts.append(remaining[:split_pos])
-                remaining = remaining[split_pos + 1:]
+            split_pos = message.rfind("\n", start, end)
+            if split_pos - start > min_split:
+                parts.append(message[start:split_pos])
+                start = split_pos + 1
                 continue
 
             # Hard split at max_length
-            parts.append(remaining[:max_length])
-            remaining = remaining[max_length:]
+            parts.append(message[start:end])
+            start = end
 
         return parts
 
@@ -1226,12 +1247,11 @@ AI Assistant:
         """Truncate a task description at a word boundary with ellipsis."""
         if len(desc) <= max_len:
             return desc
-        # Find last space before the limit to avoid cutting mid-word
-        truncated = desc[:max_len]
-        last_space = truncated.rfind(" ")
-        if last_space > max_len // 2:
-            truncated = truncated[:last_space]
-        return truncated + "..."
+        # Find last space in the back half of the limit to avoid cutting
+        # mid-word; searching desc in place means only one slice is made
+        last_space = desc.rfind(" ", max_len // 2 + 1, max_len)
+        cut = last_space if last_space != -1 else max_len
+        return desc[:cut] + "..."
 
     def _check_task_busy(self, sender: str, project: str) -> Optional[str]:
         """Return a busy message if a task is running for this sender+project, else None."""
@@ -523,7 +523,12 @@ class ClaudeRunner:
             effective_cwd = project_path or self.current_project
 
             # Optionally wrap in Docker sandbox
-            from .sandbox import build_sandbox_command, SandboxConfig, validate_docker_available
+            from .sandbox import (
+                SandboxConfig,
+                build_sandbox_command,
+                reset_docker_check,
+                validate_docker_available,
+            )
 
             sandbox_settings = self.config.sandbox_config
             if sandbox_settings.get("enabled", False):
@@ -602,6 +607,12 @@ class ClaudeRunner:
             if return_code != 0:
                 category = classify_error(return_code, output, errors)
 
+                # Daemon went away since the cached check - re-verify next run
+                if sandbox_settings.get("enabled", False) and (
+                    "Cannot connect to the Docker daemon" in errors
+                ):
+                    reset_docker_check()
+
                 combined_output = output + errors
                 if (
                     "prompt is too long" in combined_output
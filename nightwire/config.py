@@ -420,6 +420,12 @@ class Config:
         memory_config = self.settings.get("memory", {})
         return memory_config.get("max_context_tokens", 1500)
 
+    @property
+    def memory_tokenizer(self) -> str:
+        """Get token counter used for memory context budgeting."""
+        memory_config = self.settings.get("memory", {})
+        return memory_config.get("tokenizer", "heuristic")
+
     @property
     def memory_embedding_model(self) -> str:
         """Get embedding model name for semantic search."""
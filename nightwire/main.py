@@ -20,7 +20,6 @@ def setup_logging():
 
     structlog.configure(
         processors=[
-            structlog.stdlib.filter_by_level,
             structlog.stdlib.add_logger_name,
             structlog.stdlib.add_log_level,
             structlog.stdlib.PositionalArgumentsFormatter(),
@@ -30,7 +29,8 @@ def setup_logging():
             structlog.processors.UnicodeDecoder(),
             structlog.dev.ConsoleRenderer()
         ],
-        wrapper_class=structlog.stdlib.BoundLogger,
+        # Disabled levels (e.g. debug) return before any processor runs
+        wrapper_class=structlog.make_filtering_bound_logger(logging.INFO),
         context_class=dict,
         logger_factory=structlog.stdlib.LoggerFactory(),
         cache_logger_on_first_use=True,
@@ -65,8 +65,13 @@ async def main():
             logger.info("shutdown_requested_by_updater")
         shutdown_event.set()
 
+    def handle_signal(signum, frame):
+        # Runs between bytecodes on the main thread; defer the real work
+        # to the event loop (call_soon_threadsafe also wakes it up).
+        loop.call_soon_threadsafe(handle_shutdown, signal.Signals(signum))
+
     for sig in (signal.SIGTERM, signal.SIGINT):
-        loop.add_signal_handler(sig, handle_shutdown, sig)
+        signal.signal(sig, handle_signal)
 
     # Give the bot a way to trigger graceful shutdown (used by auto-updater)
     bot.set_shutdown_callback(handle_shutdown)
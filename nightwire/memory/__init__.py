@@ -25,6 +25,12 @@ from .database import (
 from .commands import MemoryCommands
 from .embeddings import EmbeddingService, get_embedding_service
 from .context_builder import ContextBuilder
+from .tokenizer import (
+    TokenCounter,
+    HeuristicTokenCounter,
+    TiktokenTokenCounter,
+    get_token_counter,
+)
 from .haiku_summarizer import HaikuSummarizer, get_haiku_summarizer
 
 __all__ = [
@@ -51,6 +57,10 @@ __all__ = [
     "get_embedding_service",
     # Context
     "ContextBuilder",
+    "TokenCounter",
+    "HeuristicTokenCounter",
+    "TiktokenTokenCounter",
+    "get_token_counter",
     "HaikuSummarizer",
     "get_haiku_summarizer",
 ]
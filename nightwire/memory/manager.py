@@ -9,6 +9,7 @@ import structlog
 
 from .database import DatabaseConnection, initialize_database
 from .embeddings import EmbeddingService
+from .tokenizer import get_token_counter
 from .models import (
     Conversation,
     Preference,
@@ -34,11 +35,13 @@ class MemoryManager:
         session_timeout_minutes: int = 30,
         max_context_tokens: int = 1500,
         embedding_model: str = "all-MiniLM-L6-v2",
-        enable_embeddings: bool = True
+        enable_embeddings: bool = True,
+        tokenizer: str = "heuristic"
     ):
         self.db_path = db_path
         self.session_timeout = session_timeout_minutes
         self.max_context_tokens = max_context_tokens
+        self.token_counter = get_token_counter(tokenizer)
         self._db: Optional[DatabaseConnection] = None
         self._embeddings: Optional[EmbeddingService] = None
         self._embedding_model = embedding_model
@@ -412,7 +415,7 @@ class MemoryManager:
 
         from .context_builder import ContextBuilder
 
-        builder = ContextBuilder(max_tokens=max_tokens)
+        builder = ContextBuilder(max_tokens=max_tokens, token_counter=self.token_counter)
 
         # Get preferences
         preferences = await self.get_preferences(phone_number)
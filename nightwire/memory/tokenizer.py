@@ -0,0 +1,86 @@
+"""Token counting for memory context budgeting.
+
+The heuristic counter needs no dependencies. The tiktoken counter gives
+exact counts and is used when ``memory.tokenizer: tiktoken`` is configured
+and the optional ``tiktoken`` package is installed.
+"""
+
+import functools
+from typing import List, Protocol
+
+import structlog
+
+logger = structlog.get_logger()
+
+DEFAULT_TIKTOKEN_ENCODING = "cl100k_base"
+
+
+class TokenCounter(Protocol):
+    """Counts tokens in text for context budgeting."""
+
+    def count_tokens(self, text: str) -> int:
+        """Return the number of tokens in text."""
+        ...
+
+    def count_tokens_batch(self, texts: List[str]) -> List[int]:
+        """Return the number of tokens in each text, in order."""
+        ...
+
+
+class HeuristicTokenCounter:
+    """Approximate token counter (1 token ≈ 4 characters)."""
+
+    def count_tokens(self, text: str) -> int:
+        return len(text) // 4
+
+    def count_tokens_batch(self, texts: List[str]) -> List[int]:
+        return [len(text) // 4 for text in texts]
+
+
+@functools.lru_cache(maxsize=None)
+def _get_encoding(name: str):
+    """Load a tiktoken encoding once per process."""
+    import tiktoken
+    return tiktoken.get_encoding(name)
+
+
+class TiktokenTokenCounter:
+    """Exact token counter backed by tiktoken (lazily imported)."""
+
+    def __init__(self, encoding_name: str = DEFAULT_TIKTOKEN_ENCODING):
+        self.encoding_name = encoding_name
+        # Load eagerly so a missing package surfaces at construction time
+        _get_encoding(encoding_name)
+
+    def count_tokens(self, text: str) -> int:
+        # disallowed_special=() treats text like "<|endoftext|>" in user content
+        # as plain text instead of raising
+        return len(_get_encoding(self.encoding_name).encode(text, disallowed_special=()))
+
+    def count_tokens_batch(self, texts: List[str]) -> List[int]:
+        encoded = _get_encoding(self.encoding_name).encode_batch(
+            texts, disallowed_special=()
+        )
+        return [len(ids) for ids in encoded]
+
+
+def get_token_counter(name: str = "heuristic") -> TokenCounter:
+    """Create a token counter by name, falling back to the heuristic.
+
+    Args:
+        name: "heuristic" or "tiktoken"
+
+    Returns:
+        A TokenCounter instance
+    """
+    if name == "tiktoken":
+        try:
+            return TiktokenTokenCounter()
+        except ImportError:
+            logger.warning("tokenizer_tiktoken_not_installed",
+                           msg="Install with: pip install tiktoken")
+        except Exception as e:
+            logger.warning("tokenizer_tiktoken_load_failed", error=str(e))
+    elif name != "heuristic":
+        logger.warning("tokenizer_unknown", tokenizer=name)
+    return HeuristicTokenCounter()
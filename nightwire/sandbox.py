@@ -1,18 +1,33 @@
 """Docker sandbox for task execution."""
 
+import functools
 import subprocess
+import time
 from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 import structlog
 
+__all__ = [
+    "SandboxConfig",
+    "build_sandbox_command",
+    "reset_docker_check",
+    "validate_docker_available",
+]
+
 logger = structlog.get_logger()
 
+# Last `docker info` result as (monotonic timestamp, result); cleared by
+# reset_docker_check(). Failures expire quickly so recovery is noticed fast.
+_docker_check: Optional[Tuple[float, Tuple[bool, str]]] = None
+_DOCKER_OK_TTL = 60.0  # seconds
+_DOCKER_FAIL_TTL = 5.0  # seconds
+
 
-@dataclass
+@dataclass(frozen=True)
 class SandboxConfig:
-    """Configuration for Docker sandbox."""
+    """Configuration for Docker sandbox (frozen so it can key the argv cache)."""
     enabled: bool = False
     image: str = "nightwire-sandbox:latest"
     network: bool = False
@@ -25,9 +40,27 @@ class SandboxConfig:
 def validate_docker_available() -> Tuple[bool, str]:
     """Check if Docker daemon is accessible.
 
+    `docker info` is slow (it queries the daemon), so the result is cached:
+    a success for 60 seconds, a failure for 5 seconds.
+
     Returns:
         Tuple of (available, error_message). error_message is empty if available.
     """
+    global _docker_check
+    now = time.monotonic()
+    if _docker_check is not None:
+        checked_at, cached = _docker_check
+        ttl = _DOCKER_OK_TTL if cached[0] else _DOCKER_FAIL_TTL
+        if now - checked_at < ttl:
+            return cached
+
+    result = _run_docker_info()
+    _docker_check = (now, result)
+    return result
+
+
+def _run_docker_info() -> Tuple[bool, str]:
+    """Run `docker info` and translate the outcome into (available, error)."""
     try:
         result = subprocess.run(
             ["docker", "info"],
@@ -57,6 +90,12 @@ def validate_docker_available() -> Tuple[bool, str]:
         )
 
 
+def reset_docker_check() -> None:
+    """Forget the cached Docker check so the next call re-runs it."""
+    global _docker_check
+    _docker_check = None
+
+
 def build_sandbox_command(
     cmd: List[str],
     project_path: Path,
@@ -71,6 +110,26 @@ def build_sandbox_command(
     if not config.enabled:
         return cmd
 
+    docker_cmd = [
+        *_sandbox_options(config, runner_type),
+        "-v", f"{project_path}:{project_path}:rw",
+        "-w", str(project_path),
+        config.image,
+        *cmd,
+    ]
+
+    logger.info("sandbox_command_built", project=str(project_path), network=config.network)
+
+    return docker_cmd
+
+
+@functools.lru_cache(maxsize=16)
+def _sandbox_options(config: SandboxConfig, runner_type: str) -> Tuple[str, ...]:
+    """Build the invariant `docker run` options for a config and runner.
+
+    The project mount, image and command are appended per call and kept out
+    of the cache key: some runners pass the whole prompt as an argument.
+    """
     docker_cmd = [
         "docker", "run",
         "--rm",
@@ -82,8 +141,6 @@ def build_sandbox_command(
         f"--memory={config.memory_limit}",
         f"--cpus={config.cpu_limit}",
         "--tmpfs", f"/tmp:size={config.tmpfs_size}",
-        "-v", f"{project_path}:{project_path}:rw",
-        "-w", str(project_path),
     ]
 
     if not config.network:
@@ -132,9 +189,4 @@ def build_sandbox_command(
             "-e", "ANTHROPIC_API_KEY",
         ])
 
-    docker_cmd.append(config.image)
-    docker_cmd.extend(cmd)
-
-    logger.info("sandbox_command_built", project=str(project_path), network=config.network)
-
-    return docker_cmd
+    return tuple(docker_cmd)
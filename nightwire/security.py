@@ -1,6 +1,5 @@
 """Security module for nightwire."""
 
-import asyncio
 import functools
 import inspect
 import re
@@ -75,14 +74,14 @@ def check_rate_limit(phone_number: str) -> str:
     return "allowed"
 
 
-# Lock for rate limiter dict operations in async context
-_rate_limit_lock = asyncio.Lock()
-
-
 async def check_rate_limit_async(phone_number: str) -> str:
-    """Async-safe version of check_rate_limit."""
-    async with _rate_limit_lock:
-        return check_rate_limit(phone_number)
+    """Async-safe version of check_rate_limit.
+
+    check_rate_limit never awaits, so it runs to completion within one event
+    loop step and needs no lock; a shared lock only serialized independent
+    senders behind each other.
+    """
+    return check_rate_limit(phone_number)
 
 
 def _reset_rate_limits():
@@ -176,21 +175,25 @@ def validate_project_path(path: str) -> Optional[Path]:
 
 
 def require_valid_project_path(func):
-    """Decorator that validates the first 'path' argument via validate_project_path.
+    """Decorator that validates the 'path' argument via validate_project_path.
 
     Raises ValueError if path validation fails. Works with both positional
-    and keyword 'path' arguments. Supports sync and async functions.
+    and keyword 'path' arguments (or the first positional argument if the
+    function has no 'path' parameter). Supports sync and async functions.
     """
+    # Resolve where 'path' sits once, at decoration time
+    path_index = _path_arg_index(func)
+
     @functools.wraps(func)
     def sync_wrapper(*args, **kwargs):
-        path = _extract_path(args, kwargs)
+        path = _extract_path(args, kwargs, path_index)
         if validate_project_path(str(path)) is None:
             raise ValueError(f"Path validation failed: access denied")
         return func(*args, **kwargs)
 
     @functools.wraps(func)
     async def async_wrapper(*args, **kwargs):
-        path = _extract_path(args, kwargs)
+        path = _extract_path(args, kwargs, path_index)
         if validate_project_path(str(path)) is None:
             raise ValueError(f"Path validation failed: access denied")
         return await func(*args, **kwargs)
@@ -200,12 +203,21 @@ def require_valid_project_path(func):
     return sync_wrapper
 
 
-def _extract_path(args, kwargs):
-    """Extract the path argument from args/kwargs. First positional arg or 'path' kwarg."""
+def _path_arg_index(func) -> int:
+    """Return the positional index of func's 'path' parameter, or 0 if it has none."""
+    positional = [
+        p.name for p in inspect.signature(func).parameters.values()
+        if p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD)
+    ]
+    return positional.index("path") if "path" in positional else 0
+
+
+def _extract_path(args, kwargs, index=0):
+    """Extract the path argument from args/kwargs: 'path' kwarg or args[index]."""
     if "path" in kwargs:
         return kwargs["path"]
-    if args:
-        return args[0]
+    if len(args) > index:
+        return args[index]
     raise ValueError("No path argument found")
 
 
@@ -1,11 +1,13 @@
 """Auto-update module for nightwire."""
 
 import asyncio
+import functools
 import re
 import subprocess
 import sys
+import time
 from pathlib import Path
-from typing import Callable, Awaitable, Optional
+from typing import Callable, Awaitable, Optional, Tuple
 
 import structlog
 
@@ -43,6 +45,10 @@ class AutoUpdater:
         self._check_task: Optional[asyncio.Task] = None
         self.update_applied = False  # True after successful update (signals restart needed)
 
+        # A pending update found by a fetch this recent is reported without re-fetching
+        self._last_fetch_ts: Optional[float] = None  # time.monotonic() of last fetch
+        self._min_fetch_gap = 30.0  # seconds
+
     async def _run_git(self, *args: str) -> str:
         """Run a git command and return stripped stdout."""
         cmd = ["git", "-C", str(self.repo_dir)] + list(args)
@@ -55,13 +61,83 @@ class AutoUpdater:
             )
         return result.stdout.strip()
 
+    @functools.cached_property
+    def _repo(self):
+        """pygit2 Repository for in-process ref reads, or None if unavailable."""
+        try:
+            import pygit2
+        except ImportError:
+            return None
+        try:
+            return pygit2.Repository(str(self.repo_dir))
+        except Exception as e:
+            logger.warning("updater_pygit2_open_failed", error=str(e))
+            return None
+
+    def _pygit2_heads(self) -> Optional[Tuple[str, str]]:
+        """Blocking pygit2 read of (local HEAD, origin/<branch>), or None."""
+        repo = self._repo
+        if repo is None:
+            return None
+        remote_ref = repo.references[f"refs/remotes/origin/{self.branch}"]
+        return str(repo.head.target), str(remote_ref.resolve().target)
+
+    def _pygit2_update_details(
+        self, local_head: str, remote_head: str
+    ) -> Optional[Tuple[str, str]]:
+        """Blocking pygit2 read of (commits behind, latest subject), or None."""
+        repo = self._repo
+        if repo is None:
+            return None
+        ahead, _ = repo.ahead_behind(remote_head, local_head)
+        message = repo[remote_head].message.strip()
+        subject = " ".join(message.split("\n\n", 1)[0].split("\n"))
+        return str(ahead), subject
+
+    async def _read_heads(self) -> Tuple[str, str]:
+        """Return (local HEAD, origin/<branch>) SHAs."""
+        try:
+            # pygit2 reads hit the disk; keep them off the event loop like _run_git
+            heads = await asyncio.to_thread(self._pygit2_heads)
+        except Exception as e:
+            logger.debug("updater_pygit2_read_failed", error=str(e))
+            heads = None
+        if heads is not None:
+            return heads
+        # One rev-parse resolves both refs (one SHA per line)
+        heads_out = await self._run_git("rev-parse", "HEAD", f"origin/{self.branch}")
+        local_head, remote_head = heads_out.splitlines()
+        return local_head, remote_head
+
+    async def _read_update_details(self, local_head: str, remote_head: str) -> Tuple[str, str]:
+        """Return (commits behind origin/<branch>, subject of its latest commit)."""
+        try:
+            # ahead_behind walks commit history, so run it in a worker thread
+            details = await asyncio.to_thread(
+                self._pygit2_update_details, local_head, remote_head
+            )
+        except Exception as e:
+            logger.debug("updater_pygit2_read_failed", error=str(e))
+            details = None
+        if details is not None:
+            return details
+        # Independent read-only queries; run them concurrently
+        commit_count, latest_msg = await asyncio.gather(
+            self._run_git("rev-list", "--count", f"HEAD..origin/{self.branch}"),
+            self._run_git("log", "--format=%s", "-1", f"origin/{self.branch}"),
+        )
+        return commit_count, latest_msg
+
     async def check_for_updates(self) -> bool:
         """Check if remote has new commits. Returns True if update available."""
         async with self._lock:
+            if (self.pending_update and self._last_fetch_ts is not None
+                    and time.monotonic() - self._last_fetch_ts < self._min_fetch_gap):
+                return True
             try:
                 await self._run_git("fetch", "origin", self.branch)
-                local_head = await self._run_git("rev-parse", "HEAD")
-                remote_head = await self._run_git("rev-parse", f"origin/{self.branch}")
+                self._last_fetch_ts = time.monotonic()
+                local_head, remote_head = await self._read_heads()
 
                 if local_head == remote_head:
                     self.pending_update = False
@@ -73,11 +149,8 @@ class AutoUpdater:
                     return True
 
                 # New update - get details and notify
-                commit_count = await self._run_git(
-                    "rev-list", "--count", f"HEAD..origin/{self.branch}"
-                )
-                latest_msg = await self._run_git(
-                    "log", "--format=%s", "-1", f"origin/{self.branch}"
+                commit_count, latest_msg = await self._read_update_details(
+                    local_head, remote_head
                 )
 
                 self.pending_update = True
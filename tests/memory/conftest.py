@@ -0,0 +1,38 @@
+"""Shared fixtures for memory tests."""
+
+import re
+from unittest.mock import patch
+
+import pytest
+
+
+class FakeEncoding:
+    """Offline stand-in for a tiktoken Encoding: one token per word or symbol."""
+
+    SPECIAL_TOKENS = ("<|endoftext|>",)
+    _TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+    def __init__(self):
+        self.calls = []
+
+    def _encode(self, text, disallowed_special):
+        # Like tiktoken, special-token text raises unless explicitly allowed
+        if disallowed_special == "all" and any(t in text for t in self.SPECIAL_TOKENS):
+            raise ValueError("Encountered text corresponding to disallowed special token")
+        return self._TOKEN_RE.findall(text)
+
+    def encode(self, text, disallowed_special="all"):
+        self.calls.append("encode")
+        return self._encode(text, disallowed_special)
+
+    def encode_batch(self, texts, disallowed_special="all"):
+        self.calls.append("encode_batch")
+        return [self._encode(text, disallowed_special) for text in texts]
+
+
+@pytest.fixture
+def fake_encoding():
+    """Serve FakeEncoding in place of a downloaded tiktoken encoding."""
+    encoding = FakeEncoding()
+    with patch("nightwire.memory.tokenizer._get_encoding", return_value=encoding):
+        yield encoding
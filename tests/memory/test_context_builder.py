@@ -5,6 +5,11 @@ from datetime import datetime
 import pytest
 
 from nightwire.memory.context_builder import ContextBuilder
+from nightwire.memory.tokenizer import (
+    HeuristicTokenCounter,
+    TiktokenTokenCounter,
+    get_token_counter,
+)
 from nightwire.memory.models import (
     Conversation,
     ExplicitMemory,
@@ -38,26 +43,26 @@ def _make_conv(role, content, minutes_ago=0, project="testproject"):
 
 class TestFormatCommandHistory:
     def test_empty_history_returns_empty(self, builder):
-        assert builder._format_command_history([], 5000) == ""
+        assert builder._format_command_history([], 5000) == ("", 0)
 
     def test_none_history_returns_empty(self, builder):
-        assert builder._format_command_history(None, 5000) == ""
+        assert builder._format_command_history(None, 5000) == ("", 0)
 
     def test_basic_command_pair(self, builder):
         history = [
             _make_conv("user", "/do add a login page", minutes_ago=0),
             _make_conv("assistant", "I've added a login page with form fields.", minutes_ago=1),
         ]
-        result = builder._format_command_history(history, 5000)
-        assert "## Recent Command History" in result
-        assert "User: add a login page" in result  # /do prefix stripped
-        assert "Claude: I've added a login page" in result
+        result, _ = builder._format_command_history(history, 5000)
+        assert "# Recent Command History" in result
+        assert "User - add a login page" in result  # /do prefix stripped
+        assert "Claude - I've added a login page" in result
 
     def test_strips_do_prefix(self, builder):
         history = [
             _make_conv("user", "/do implement the feature", minutes_ago=0),
         ]
-        result = builder._format_command_history(history, 5000)
+        result, _ = builder._format_command_history(history, 5000)
         assert "/do" not in result
         assert "implement the feature" in result
 
@@ -65,7 +70,7 @@ class TestFormatCommandHistory:
         history = [
             _make_conv("user", "just a plain message", minutes_ago=0),
         ]
-        result = builder._format_command_history(history, 5000)
+        result, _ = builder._format_command_history(history, 5000)
         assert "just a plain message" in result
 
     def test_truncates_long_assistant_responses(self, builder):
@@ -73,7 +78,7 @@ class TestFormatCommandHistory:
         history = [
             _make_conv("assistant", long_response, minutes_ago=0),
         ]
-        result = builder._format_command_history(history, 5000)
+        result, _ = builder._format_command_history(history, 5000)
         assert "..." in result
         # Should be truncated to ~500 chars for assistant
         assert len(result) < 700
@@ -83,10 +88,10 @@ class TestFormatCommandHistory:
         history = [
             _make_conv("user", long_msg, minutes_ago=0),
         ]
-        result = builder._format_command_history(history, 5000)
+        result, _ = builder._format_command_history(history, 5000)
         assert "..." in result
 
-    def test_respects_max_chars_limit(self, builder):
+    def test_respects_max_tokens_limit(self, builder):
         history = [
             _make_conv("user", "/do task one", minutes_ago=0),
             _make_conv("assistant", "Done with task one.", minutes_ago=1),
@@ -94,13 +99,19 @@ class TestFormatCommandHistory:
             _make_conv("assistant", "Done with task two.", minutes_ago=3),
         ]
         # Very small budget
-        result = builder._format_command_history(history, 100)
+        result, _ = builder._format_command_history(history, 25)
         # Should include at least the header and maybe one entry
-        assert "## Recent Command History" in result
+        assert "# Recent Command History" in result
         # Should not include all entries
         lines = [l for l in result.split("\n") if l.strip()]
         assert len(lines) < 5
 
+    def test_reports_tokens_used(self, builder):
+        history = [_make_conv("user", "/do task one", minutes_ago=0)]
+        result, tokens = builder._format_command_history(history, 5000)
+        assert result
+        assert 0 < tokens <= 5000
+
     def test_multiple_command_pairs(self, builder):
         history = [
             _make_conv("user", "/do add login page", minutes_ago=0),
@@ -108,7 +119,7 @@ class TestFormatCommandHistory:
             _make_conv("user", "/do add validation", minutes_ago=2),
             _make_conv("assistant", "Added validation.", minutes_ago=3),
         ]
-        result = builder._format_command_history(history, 5000)
+        result, _ = builder._format_command_history(history, 5000)
         assert "add login page" in result
         assert "Added login page" in result
         assert "add validation" in result
@@ -123,7 +134,7 @@ class TestBuildContextSectionWithCommandHistory:
         ]
         result = builder.build_context_section(command_history=history)
         assert "# Memory Context" in result
-        assert "## Recent Command History" in result
+        assert "# Recent Command History" in result
         assert "create API endpoint" in result
 
     def test_command_history_appears_before_semantic_search(self, builder):
@@ -143,8 +154,8 @@ class TestBuildContextSectionWithCommandHistory:
             command_history=history,
             relevant_history=search,
         )
-        cmd_pos = result.find("## Recent Command History")
-        search_pos = result.find("## Relevant Past Context")
+        cmd_pos = result.find("# Recent Command History")
+        search_pos = result.find("# Relevant Past Context")
         assert cmd_pos < search_pos
 
     def test_command_history_with_preferences_and_memories(self, builder):
@@ -157,9 +168,9 @@ class TestBuildContextSectionWithCommandHistory:
             explicit_memories=mems,
             command_history=history,
         )
-        assert "## User Preferences" in result
-        assert "## Remembered Facts" in result
-        assert "## Recent Command History" in result
+        assert "# User Preferences" in result
+        assert "# Remembered Facts" in result
+        assert "# Recent Command History" in result
 
     def test_no_context_returns_empty(self, builder):
         result = builder.build_context_section()
@@ -178,7 +189,7 @@ class TestExistingContextBuilderBehavior:
     def test_preferences_only(self, builder):
         prefs = [Preference(phone_number="+1", category="tech", key="lang", value="Python")]
         result = builder.build_context_section(preferences=prefs)
-        assert "tech/lang: Python" in result
+        assert "tech lang - Python" in result
 
     def test_memories_only(self, builder):
         mems = [ExplicitMemory(phone_number="+1", memory_text="Use pytest")]
@@ -214,3 +225,100 @@ class TestExistingContextBuilderBehavior:
         )
         assert "This is a summary" in result
         assert "raw history" not in result
+
+
+class WordTokenCounter:
+    """Counts one token per whitespace-separated word."""
+
+    def count_tokens(self, text):
+        return len(text.split())
+
+    def count_tokens_batch(self, texts):
+        self.batch_calls = getattr(self, "batch_calls", 0) + 1
+        return [self.count_tokens(t) for t in texts]
+
+
+class TestTokenCounter:
+    def test_default_counter_is_heuristic(self, builder):
+        assert isinstance(builder.token_counter, HeuristicTokenCounter)
+        assert builder.estimate_tokens("x" * 400) == 100
+
+    def test_custom_counter_drives_budget(self):
+        history = [
+            _make_conv("user", "/do " + " ".join(["word"] * 20), minutes_ago=i)
+            for i in range(5)
+        ]
+        builder = ContextBuilder(max_tokens=60, token_counter=WordTokenCounter())
+        result, _ = builder._format_command_history(history, 60)
+        # Header is 4 words, each line 22 words (+1 newline): only two lines fit
+        lines = [l for l in result.split("\n") if l.strip()]
+        assert len(lines) == 3
+        # Candidates are counted in a single batch call
+        assert builder.token_counter.batch_calls == 1
+
+    def test_tiktoken_counter_batches_each_section(self, fake_encoding):
+        history = [_make_conv("user", f"/do task {i}", minutes_ago=i) for i in range(5)]
+        builder = ContextBuilder(max_tokens=500, token_counter=TiktokenTokenCounter())
+        result = builder.build_context_section(command_history=history)
+        assert "task 4" in result
+        # One encode for the header, one encode_batch for all five lines
+        assert fake_encoding.calls == ["encode", "encode_batch"]
+
+    def test_budgeted_sections_are_not_recounted(self):
+        counted = []
+
+        class RecordingCounter:
+            def count_tokens(self, text):
+                counted.append(text)
+                return len(text.split())
+
+            def count_tokens_batch(self, texts):
+                return [len(t.split()) for t in texts]
+
+        history = [_make_conv("user", "/do one", minutes_ago=0),
+                   _make_conv("assistant", "done", minutes_ago=1)]
+        builder = ContextBuilder(max_tokens=500, token_counter=RecordingCounter())
+        result = builder.build_context_section(command_history=history)
+        assert "# Recent Command History" in result
+        # Only the header is counted singly; the joined section never is
+        assert counted == ["# Recent Command History"]
+
+
+class TestCompactDelimiters:
+    SAMPLE = [
+        _make_conv("user", "/do add a login page", minutes_ago=0),
+        _make_conv("assistant", "Added the login page with validation.", minutes_ago=1),
+        _make_conv("user", "/do write tests for it", minutes_ago=2),
+        _make_conv("assistant", "Wrote 12 tests, all passing.", minutes_ago=3),
+    ]
+
+    def test_history_lines_use_compact_format(self, builder):
+        result, _ = builder._format_command_history(self.SAMPLE, 5000)
+        assert result.startswith("# Recent Command History\n")
+        assert "2026-02-28 - User - add a login page" in result
+        assert "[" not in result
+
+    def _assert_compact_format_uses_fewer_tokens(self, builder, counter):
+        old_lines = ["## Recent Command History"] + [
+            f"[2026-02-28] {'User' if c.role == 'user' else 'Claude'}: "
+            f"{c.content.replace('/do ', '', 1)}"
+            for c in self.SAMPLE
+        ] + ["## User Preferences", "- style/indent: 4 spaces"]
+        new_lines = [builder._format_command_history(self.SAMPLE, 5000)[0]] + [
+            builder._format_preferences(
+                [Preference(phone_number="+1", category="style", key="indent", value="4 spaces")]
+            )
+        ]
+        assert counter.count_tokens("\n".join(new_lines)) < counter.count_tokens(
+            "\n".join(old_lines)
+        )
+
+    def test_compact_format_uses_fewer_tokens(self, builder, fake_encoding):
+        self._assert_compact_format_uses_fewer_tokens(builder, TiktokenTokenCounter())
+
+    def test_compact_format_uses_fewer_tokens_with_real_tiktoken(self, builder):
+        pytest.importorskip("tiktoken")
+        counter = get_token_counter("tiktoken")
+        if not isinstance(counter, TiktokenTokenCounter):
+            pytest.skip("tiktoken encoding could not be loaded")
+        self._assert_compact_format_uses_fewer_tokens(builder, counter)
@@ -0,0 +1,67 @@
+"""Tests for token counting."""
+
+from unittest.mock import patch
+
+import pytest
+
+from nightwire.memory.tokenizer import (
+    HeuristicTokenCounter,
+    TiktokenTokenCounter,
+    _get_encoding,
+    get_token_counter,
+)
+
+
+class TestHeuristicTokenCounter:
+    def test_counts_four_chars_per_token(self):
+        assert HeuristicTokenCounter().count_tokens("x" * 400) == 100
+
+    def test_batch_matches_single_counts(self):
+        counter = HeuristicTokenCounter()
+        texts = ["", "abcd", "x" * 41]
+        assert counter.count_tokens_batch(texts) == [counter.count_tokens(t) for t in texts]
+
+
+class TestGetTokenCounter:
+    def test_default_is_heuristic(self):
+        assert isinstance(get_token_counter(), HeuristicTokenCounter)
+
+    def test_unknown_tokenizer_falls_back_to_heuristic(self):
+        assert isinstance(get_token_counter("nope"), HeuristicTokenCounter)
+
+    def test_missing_tiktoken_falls_back_to_heuristic(self):
+        _get_encoding.cache_clear()
+        with patch.dict("sys.modules", {"tiktoken": None}):
+            assert isinstance(get_token_counter("tiktoken"), HeuristicTokenCounter)
+        _get_encoding.cache_clear()
+
+
+class TestTiktokenTokenCounter:
+    def test_selected_by_name(self, fake_encoding):
+        assert isinstance(get_token_counter("tiktoken"), TiktokenTokenCounter)
+
+    def test_counts_tokens_from_encoding(self, fake_encoding):
+        counter = TiktokenTokenCounter()
+        assert counter.count_tokens("hello world") == 2
+        assert fake_encoding.calls == ["encode"]
+
+    def test_batch_uses_one_encode_batch_call(self, fake_encoding):
+        counter = TiktokenTokenCounter()
+        assert counter.count_tokens_batch(["hello world", "hi", "a - b"]) == [2, 1, 3]
+        assert fake_encoding.calls == ["encode_batch"]
+
+    def test_special_token_text_does_not_raise(self, fake_encoding):
+        """Special-token text in user content is counted as plain text."""
+        counter = TiktokenTokenCounter()
+        assert counter.count_tokens("<|endoftext|>") > 0
+        assert counter.count_tokens_batch(["<|endoftext|>", "hi"])[0] > 0
+
+    def test_counts_exactly_with_real_tiktoken(self):
+        pytest.importorskip("tiktoken")
+        counter = get_token_counter("tiktoken")
+        if not isinstance(counter, TiktokenTokenCounter):
+            pytest.skip("tiktoken encoding could not be loaded")
+        assert counter.count_tokens("hello world") == 2
+        # Special-token text in user content must not raise
+        assert counter.count_tokens("<|endoftext|>") > 0
+        assert counter.count_tokens_batch(["hello world", "hi"]) == [2, 1]
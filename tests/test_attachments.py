@@ -1,171 +1,277 @@
 """Tests for attachment handling — download, save, and integration with message pipeline."""
 
 import asyncio
+import os
+import threading
 from pathlib import Path
-from unittest.mock import AsyncMock, MagicMock, patch
+from unittest.mock import ANY, MagicMock, call, patch
 
 import aiohttp
 import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
 
 from nightwire.attachments import (
+    DOWNLOAD_CHUNK_SIZE,
     SUPPORTED_IMAGE_TYPES,
-    download_attachment,
+    _attachment_path,
+    _open_for_write,
+    download_attachment_to_file,
     process_attachments,
-    save_attachment,
 )
 
 
-class TestDownloadAttachment:
-    """Tests for download_attachment()."""
-
-    @pytest.fixture
-    def session(self):
-        return MagicMock(spec=aiohttp.ClientSession)
+class SignalAPIStub:
+    """In-process Signal API serving attachment bodies from a dict."""
+
+    def __init__(self, session: aiohttp.ClientSession, url: str):
+        self.session = session
+        self.url = url
+        self.attachments = {}  # attachment_id -> body bytes
+        self.delay = 0.0
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.stall = None  # asyncio.Event; when set up, stall after the first chunk
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        self.requests += 1
+        body = self.attachments.get(request.match_info["attachment_id"])
+        if body is None:
+            return web.Response(status=404)
+        if self.stall is not None:
+            resp = web.StreamResponse()
+            await resp.prepare(request)
+            await resp.write(body)
+            await self.stall.wait()
+            return resp
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        return web.Response(body=body)
+
+
+@pytest.fixture
+async def signal_api():
+    app = web.Application()
+    server = TestServer(app)
+    async with aiohttp.ClientSession() as session:
+        stub = SignalAPIStub(session, "")
+        app.router.add_get("/v1/attachments/{attachment_id}", stub.handle)
+        await server.start_server()
+        stub.url = str(server.make_url("")).rstrip("/")
+        yield stub
+    await server.close()
+
+
+class TestDownloadAttachmentToFile:
+    """Tests for download_attachment_to_file()."""
 
     @pytest.mark.asyncio
-    async def test_rejects_path_traversal(self, session):
-        """SSRF prevention: reject IDs with path traversal."""
-        result = await download_attachment(session, "http://localhost:8080", "../etc/passwd")
-        assert result is None
+    async def test_streams_body_to_dest(self, signal_api, tmp_path):
+        dest = tmp_path / "image.jpg"
+        signal_api.attachments["abc.jpg"] = b"part1part2"
 
-    @pytest.mark.asyncio
-    async def test_rejects_double_dot_traversal(self, session):
-        """SSRF prevention: reject IDs containing '..' even without slashes."""
-        result = await download_attachment(session, "http://localhost:8080", "..something")
-        assert result is None
+        ok = await download_attachment_to_file(
+            signal_api.session, signal_api.url, "abc.jpg", dest
+        )
 
-    @pytest.mark.asyncio
-    async def test_rejects_attachment_id_with_slashes(self, session):
-        result = await download_attachment(session, "http://localhost:8080", "foo/bar")
-        assert result is None
+        assert ok is True
+        assert dest.read_bytes() == b"part1part2"
+        assert dest.stat().st_mode & 0o777 == 0o600
+        assert list(tmp_path.iterdir()) == [dest]
 
     @pytest.mark.asyncio
-    async def test_accepts_attachment_id_with_extension(self):
-        """Signal API returns IDs with file extensions (e.g., '09GIqaSf01wyBX0zokr7.jpg')."""
-        mock_resp = AsyncMock()
-        mock_resp.status = 200
-        mock_resp.__aenter__ = AsyncMock(return_value=mock_resp)
-        mock_resp.__aexit__ = AsyncMock(return_value=False)
-
-        async def fake_chunks():
-            yield b"image_data_here"
-
-        mock_resp.content.iter_chunked = MagicMock(return_value=fake_chunks())
-
-        session = MagicMock(spec=aiohttp.ClientSession)
-        session.get = MagicMock(return_value=mock_resp)
-
-        result = await download_attachment(session, "http://localhost:8080", "09GIqaSf01wyBX0zokr7.jpg")
-        assert result == b"image_data_here"
+    async def test_reads_body_in_tuned_chunks(self, signal_api, tmp_path):
+        signal_api.attachments["abc.jpg"] = b"data"
+        with patch.object(
+            aiohttp.StreamReader, "iter_chunked", autospec=True,
+            side_effect=aiohttp.StreamReader.iter_chunked,
+        ) as iter_chunked:
+            ok = await download_attachment_to_file(
+                signal_api.session, signal_api.url, "abc.jpg", tmp_path / "image.jpg"
+            )
+
+        assert ok is True
+        assert DOWNLOAD_CHUNK_SIZE == 256 * 1024
+        iter_chunked.assert_called_once_with(ANY, DOWNLOAD_CHUNK_SIZE)
 
     @pytest.mark.asyncio
-    async def test_accepts_attachment_id_with_hyphen(self):
-        """Signal API IDs may contain hyphens (e.g., '-nVtmdGVEJuCnLsmgc-Q.jpg')."""
-        mock_resp = AsyncMock()
-        mock_resp.status = 200
-        mock_resp.__aenter__ = AsyncMock(return_value=mock_resp)
-        mock_resp.__aexit__ = AsyncMock(return_value=False)
-
-        async def fake_chunks():
-            yield b"image_data_here"
+    async def test_oversized_download_leaves_no_file(self, signal_api, tmp_path):
+        dest = tmp_path / "image.jpg"
+        signal_api.attachments["abc.jpg"] = b"1234567890"
 
-        mock_resp.content.iter_chunked = MagicMock(return_value=fake_chunks())
-
-        session = MagicMock(spec=aiohttp.ClientSession)
-        session.get = MagicMock(return_value=mock_resp)
+        with patch("nightwire.attachments.MAX_ATTACHMENT_SIZE", 8):
+            ok = await download_attachment_to_file(
+                signal_api.session, signal_api.url, "abc.jpg", dest
+            )
 
-        result = await download_attachment(session, "http://localhost:8080", "-nVtmdGVEJuCnLsmgc-Q.jpg")
-        assert result == b"image_data_here"
+        assert ok is False
+        assert list(tmp_path.iterdir()) == []
 
     @pytest.mark.asyncio
-    async def test_accepts_valid_attachment_id_no_extension(self):
-        """Plain alphanumeric IDs should still be accepted."""
-        mock_resp = AsyncMock()
-        mock_resp.status = 200
-        mock_resp.__aenter__ = AsyncMock(return_value=mock_resp)
-        mock_resp.__aexit__ = AsyncMock(return_value=False)
+    async def test_http_error_leaves_no_file(self, signal_api, tmp_path):
+        dest = tmp_path / "image.jpg"
 
-        async def fake_chunks():
-            yield b"image_data_here"
-
-        mock_resp.content.iter_chunked = MagicMock(return_value=fake_chunks())
+        ok = await download_attachment_to_file(
+            signal_api.session, signal_api.url, "abc.jpg", dest
+        )
 
-        session = MagicMock(spec=aiohttp.ClientSession)
-        session.get = MagicMock(return_value=mock_resp)
+        assert ok is False
+        assert list(tmp_path.iterdir()) == []
 
-        result = await download_attachment(session, "http://localhost:8080", "abc123_XYZ=-")
-        assert result == b"image_data_here"
+    @pytest.mark.asyncio
+    async def test_cancelled_download_leaves_no_file(self, signal_api, tmp_path):
+        """Cancelling mid-download (e.g. at shutdown) removes the .part file."""
+        dest = tmp_path / "image.jpg"
+        part = tmp_path / "image.jpg.part"
+        signal_api.attachments["abc.jpg"] = b"first_chunk"
+        signal_api.stall = asyncio.Event()
+
+        task = asyncio.create_task(download_attachment_to_file(
+            signal_api.session, signal_api.url, "abc.jpg", dest
+        ))
+        for _ in range(200):
+            if part.exists() and part.stat().st_size:
+                break
+            await asyncio.sleep(0.01)
+        assert part.exists()
+
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        signal_api.stall.set()
+
+        assert list(tmp_path.iterdir()) == []
 
     @pytest.mark.asyncio
-    async def test_returns_none_on_http_error(self):
-        """Non-200 status should return None."""
-        mock_resp = AsyncMock()
-        mock_resp.status = 404
-        mock_resp.__aenter__ = AsyncMock(return_value=mock_resp)
-        mock_resp.__aexit__ = AsyncMock(return_value=False)
+    async def test_cancelled_during_open_leaves_no_file(self, signal_api, tmp_path):
+        """A cancel while the worker thread is still opening the file cleans up after it."""
+        dest = tmp_path / "image.jpg"
+        signal_api.attachments["abc.jpg"] = b"data"
+        opening = threading.Event()
+        release = threading.Event()
+        opened_fds = []
+
+        def slow_open(path):
+            opening.set()
+            release.wait(5)
+            fd = _open_for_write(path)
+            opened_fds.append(fd)
+            return fd
+
+        real_close = os.close
+        with patch("nightwire.attachments._open_for_write", slow_open), \
+                patch("os.close", side_effect=real_close) as close_spy:
+            task = asyncio.create_task(download_attachment_to_file(
+                signal_api.session, signal_api.url, "abc.jpg", dest
+            ))
+            assert await asyncio.to_thread(opening.wait, 5)
+            task.cancel()
+            await asyncio.sleep(0.01)
+            release.set()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        assert list(tmp_path.iterdir()) == []
+        # The fd opened after the cancel was closed, not leaked
+        assert call(opened_fds[0]) in close_spy.call_args_list
 
-        session = MagicMock(spec=aiohttp.ClientSession)
-        session.get = MagicMock(return_value=mock_resp)
+    @pytest.mark.asyncio
+    async def test_recreates_missing_directory(self, signal_api, tmp_path):
+        dest = tmp_path / "gone" / "image.jpg"
+        signal_api.attachments["abc.jpg"] = b"data"
 
-        result = await download_attachment(session, "http://localhost:8080", "valid123")
-        assert result is None
+        ok = await download_attachment_to_file(
+            signal_api.session, signal_api.url, "abc.jpg", dest
+        )
 
+        assert ok is True
+        assert dest.read_bytes() == b"data"
+
+    @pytest.mark.parametrize("attachment_id", [
+        "09GIqaSf01wyBX0zokr7.jpg",  # Signal API returns IDs with file extensions
+        "-nVtmdGVEJuCnLsmgc-Q.jpg",  # IDs may contain hyphens
+        "abc123_XYZ=-",  # plain IDs without an extension
+    ])
+    async def test_accepts_valid_attachment_ids(self, signal_api, tmp_path, attachment_id):
+        dest = tmp_path / "image.jpg"
+        signal_api.attachments[attachment_id] = b"image_data_here"
+        ok = await download_attachment_to_file(
+            signal_api.session, signal_api.url, attachment_id, dest
+        )
+        assert ok is True
+        assert dest.read_bytes() == b"image_data_here"
+
+    @pytest.mark.parametrize("attachment_id", [
+        "../etc/passwd",  # path traversal
+        "..something",  # '..' even without slashes
+        "foo/bar",
+        "abc123\n",
+    ])
+    async def test_rejects_unsafe_attachment_ids(self, tmp_path, attachment_id):
+        """SSRF prevention: unsafe IDs are rejected before any request."""
+        session = MagicMock(spec=aiohttp.ClientSession)
+        ok = await download_attachment_to_file(
+            session, "http://localhost:8080", attachment_id, tmp_path / "x.jpg"
+        )
+        assert ok is False
+        session.get.assert_not_called()
 
-class TestSaveAttachment:
-    """Tests for save_attachment()."""
 
-    def test_saves_jpeg(self, tmp_path):
-        data = b"\xff\xd8\xff\xe0fake_jpeg"
-        result = save_attachment(data, "image/jpeg", "+15555551234", tmp_path)
-        assert result is not None
-        assert result.suffix == ".jpg"
-        assert result.read_bytes() == data
+class TestAttachmentPath:
+    """Tests for _attachment_path()."""
 
-    def test_saves_png(self, tmp_path):
-        data = b"\x89PNG\r\n\x1a\nfake_png"
-        result = save_attachment(data, "image/png", "+15555551234", tmp_path)
-        assert result is not None
+    def test_uses_extension(self, tmp_path):
+        result = _attachment_path(".png", "+15555551234", tmp_path)
         assert result.suffix == ".png"
+        assert result.parent.is_dir()
 
-    def test_rejects_unsupported_type(self, tmp_path):
-        result = save_attachment(b"data", "application/pdf", "+15555551234", tmp_path)
-        assert result is None
+    def test_paths_are_unique(self, tmp_path):
+        first = _attachment_path(".jpg", "+15555551234", tmp_path)
+        second = _attachment_path(".jpg", "+15555551234", tmp_path)
+        assert first != second
 
     def test_sanitizes_sender_directory(self, tmp_path):
         """Sender phone number should be digits only in directory name."""
-        data = b"test"
-        result = save_attachment(data, "image/jpeg", "+1 (555) 555-1234", tmp_path)
-        assert result is not None
-        # Directory should contain only digits
+        result = _attachment_path(".jpg", "+1 (555) 555-1234", tmp_path)
+        assert result.parent.name == "15555551234"
+
+    def test_non_ascii_sender_keeps_only_digits(self, tmp_path):
+        result = _attachment_path(".jpg", "+1 555\u00e9 555 1234", tmp_path)
         assert result.parent.name == "15555551234"
 
+    def test_sender_directory_created_once(self, tmp_path):
+        """Repeat paths for one sender reuse the cached directory."""
+        with patch.object(Path, "mkdir", autospec=True, side_effect=Path.mkdir) as mkdir:
+            first = _attachment_path(".jpg", "+15555550001", tmp_path)
+            second = _attachment_path(".jpg", "+15555550001", tmp_path)
+        assert first.parent == second.parent
+        assert mkdir.call_count == 1
+
     def test_unknown_sender_uses_fallback(self, tmp_path):
         """Non-digit sender should use 'unknown' directory."""
-        data = b"test"
-        result = save_attachment(data, "image/jpeg", "no-digits-here", tmp_path)
-        assert result is not None
+        result = _attachment_path(".jpg", "no-digits-here", tmp_path)
         assert result.parent.name == "unknown"
 
 
 class TestProcessAttachments:
     """Tests for process_attachments()."""
 
+    @pytest.fixture(autouse=True)
+    def _clear_saved_attachments(self):
+        from nightwire.attachments import _SAVED_ATTACHMENTS
+        _SAVED_ATTACHMENTS.clear()
+        yield
+        _SAVED_ATTACHMENTS.clear()
+
     @pytest.mark.asyncio
-    async def test_processes_image_attachment(self, tmp_path):
+    async def test_processes_image_attachment(self, signal_api, tmp_path):
         """Full pipeline: download + save for an image attachment."""
-        mock_resp = AsyncMock()
-        mock_resp.status = 200
-        mock_resp.__aenter__ = AsyncMock(return_value=mock_resp)
-        mock_resp.__aexit__ = AsyncMock(return_value=False)
-
-        async def fake_chunks():
-            yield b"fake_image_bytes"
-
-        mock_resp.content.iter_chunked = MagicMock(return_value=fake_chunks())
-
-        session = MagicMock(spec=aiohttp.ClientSession)
-        session.get = MagicMock(return_value=mock_resp)
-
+        signal_api.attachments["attachment123.jpg"] = b"fake_image_bytes"
         attachments = [
             {"id": "attachment123.jpg", "contentType": "image/jpeg", "size": 1024},
         ]
@@ -173,8 +279,8 @@ class TestProcessAttachments:
         result = await process_attachments(
             attachments=attachments,
             sender="+15555551234",
-            session=session,
-            signal_api_url="http://localhost:8080",
+            session=signal_api.session,
+            signal_api_url=signal_api.url,
             attachments_dir=tmp_path,
         )
 
@@ -182,6 +288,99 @@ class TestProcessAttachments:
         assert result[0].suffix == ".jpg"
         assert result[0].read_bytes() == b"fake_image_bytes"
 
+    @pytest.mark.asyncio
+    async def test_processes_multiple_attachments_concurrently(self, signal_api, tmp_path):
+        """Downloads overlap and saved paths keep the input order."""
+        signal_api.attachments.update({"first.jpg": b"first", "second.png": b"second"})
+        signal_api.delay = 0.05
+        attachments = [
+            {"id": "first.jpg", "contentType": "image/jpeg", "size": 5},
+            {"id": "second.png", "contentType": "image/png", "size": 6},
+        ]
+
+        result = await process_attachments(
+            attachments=attachments,
+            sender="+15555551234",
+            session=signal_api.session,
+            signal_api_url=signal_api.url,
+            attachments_dir=tmp_path,
+        )
+
+        assert signal_api.max_in_flight == 2
+        assert [p.read_bytes() for p in result] == [b"first", b"second"]
+
+    @pytest.mark.asyncio
+    async def test_limits_concurrent_downloads(self, tmp_path):
+        """No more than MAX_CONCURRENT_DOWNLOADS run at once."""
+        in_flight = 0
+        max_in_flight = 0
+
+        async def fake_download(session, signal_api_url, attachment_id, dest):
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            dest.write_bytes(b"x")
+            return True
+
+        attachments = [
+            {"id": f"att{i}.jpg", "contentType": "image/jpeg", "size": 1} for i in range(5)
+        ]
+        with patch("nightwire.attachments.MAX_CONCURRENT_DOWNLOADS", 2), \
+                patch("nightwire.attachments.download_attachment_to_file", fake_download):
+            result = await process_attachments(
+                attachments=attachments,
+                sender="+15555551234",
+                session=MagicMock(spec=aiohttp.ClientSession),
+                signal_api_url="http://localhost:8080",
+                attachments_dir=tmp_path,
+            )
+
+        assert len(result) == 5
+        assert max_in_flight == 2
+
+    @pytest.mark.asyncio
+    async def test_one_failing_attachment_does_not_drop_others(self, tmp_path):
+        async def fake_download(session, signal_api_url, attachment_id, dest):
+            if attachment_id == "bad.jpg":
+                raise RuntimeError("boom")
+            dest.write_bytes(b"x")
+            return True
+
+        attachments = [
+            {"id": "bad.jpg", "contentType": "image/jpeg", "size": 1},
+            {"id": "good.jpg", "contentType": "image/jpeg", "size": 1},
+        ]
+        with patch("nightwire.attachments.download_attachment_to_file", fake_download):
+            result = await process_attachments(
+                attachments=attachments,
+                sender="+15555551234",
+                session=MagicMock(spec=aiohttp.ClientSession),
+                signal_api_url="http://localhost:8080",
+                attachments_dir=tmp_path,
+            )
+
+        assert len(result) == 1
+
+    @pytest.mark.asyncio
+    async def test_redelivered_attachment_is_not_downloaded_again(self, signal_api, tmp_path):
+        """A saved attachment ID reuses the existing file."""
+        signal_api.attachments["attachment123.jpg"] = b"fake_image_bytes"
+        attachments = [{"id": "attachment123.jpg", "contentType": "image/jpeg", "size": 16}]
+        kwargs = dict(
+            sender="+15555551234",
+            session=signal_api.session,
+            signal_api_url=signal_api.url,
+            attachments_dir=tmp_path,
+        )
+
+        first = await process_attachments(attachments=attachments, **kwargs)
+        second = await process_attachments(attachments=attachments, **kwargs)
+
+        assert first == second
+        assert signal_api.requests == 1
+
     @pytest.mark.asyncio
     async def test_skips_non_image_attachment(self, tmp_path):
         """Non-image MIME types should be skipped."""
@@ -320,3 +519,7 @@ class TestSupportedImageTypes:
         assert SUPPORTED_IMAGE_TYPES["image/png"] == ".png"
         assert SUPPORTED_IMAGE_TYPES["image/gif"] == ".gif"
         assert SUPPORTED_IMAGE_TYPES["image/webp"] == ".webp"
+
+    def test_is_read_only(self):
+        with pytest.raises(TypeError):
+            SUPPORTED_IMAGE_TYPES["application/pdf"] = ".pdf"
@@ -6,9 +6,9 @@ from unittest.mock import MagicMock, AsyncMock, patch
 from nightwire.bot import SignalBot
 
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def bot():
-    """Create a minimal bot instance for testing _split_message."""
+    """Create a minimal bot instance for testing _split_message (stateless, so shared)."""
     with patch.object(SignalBot, "__init__", lambda self: None):
         b = SignalBot.__new__(SignalBot)
         return b
@@ -77,6 +77,13 @@ class TestSplitMessage:
         assert result[0] == "A" * 100
         assert result[1] == "A" * 100
 
+    def test_large_message_splits_on_lines(self, bot):
+        line = "A" * 99
+        msg = "\n".join([line] * 10_000)  # ~1 MB
+        result = bot._split_message(msg, max_length=5000)
+        assert all(len(p) <= 5000 for p in result)
+        assert "\n".join(result) == msg
+
 
 class TestTruncateDescription:
     def test_short_description_unchanged(self):
@@ -6,7 +6,15 @@ import pytest
 from pathlib import Path
 from unittest.mock import MagicMock, patch
 
-from nightwire.sandbox import build_sandbox_command, SandboxConfig
+from nightwire.sandbox import build_sandbox_command, reset_docker_check, SandboxConfig
+
+
+@pytest.fixture(autouse=True)
+def _reset_docker_check():
+    """Each test starts without a cached Docker availability result."""
+    reset_docker_check()
+    yield
+    reset_docker_check()
 
 
 def test_build_sandbox_command_wraps_with_docker():
@@ -221,3 +229,97 @@ def test_validate_docker_available_permission_denied():
         available, msg = validate_docker_available()
         assert available is False
         assert "permission denied" in msg.lower()
+
+
+def test_sandbox_config_is_immutable():
+    """Configs key the argv cache, so they cannot be mutated in place."""
+    config = SandboxConfig(enabled=True, memory_limit="4g")
+    with pytest.raises(AttributeError):
+        config.memory_limit = "8g"
+
+
+def test_sandbox_config_is_hashable_by_value():
+    """Equal configs hash equal, so they can key the argv cache."""
+    assert hash(SandboxConfig(enabled=True)) == hash(SandboxConfig(enabled=True))
+    assert SandboxConfig(enabled=True) != SandboxConfig(enabled=True, network=True)
+
+
+def test_build_sandbox_command_memoized_per_arguments():
+    """Invariant options are cached per config; the command stays out of the key."""
+    from nightwire.sandbox import _sandbox_options
+    _sandbox_options.cache_clear()
+    project_path = Path("/home/user/projects/myapp")
+    config = SandboxConfig(enabled=True)
+
+    first = build_sandbox_command(["claude", "-p", "first prompt"], project_path, config)
+    second = build_sandbox_command(["claude", "-p", "second prompt"], project_path, config)
+
+    assert first[:-1] == second[:-1]
+    assert first[-1] == "first prompt"
+    assert second[-1] == "second prompt"
+    assert first is not second
+    assert _sandbox_options.cache_info().hits == 1
+    assert all("prompt" not in arg for arg in _sandbox_options(config, "claude"))
+
+
+def test_build_sandbox_command_options_shared_across_projects():
+    """Different projects reuse the cached options and get their own mount."""
+    from nightwire.sandbox import _sandbox_options
+    _sandbox_options.cache_clear()
+    config = SandboxConfig(enabled=True)
+
+    first = build_sandbox_command(["claude"], Path("/srv/one"), config)
+    second = build_sandbox_command(["claude"], Path("/srv/two"), config)
+
+    assert _sandbox_options.cache_info().hits == 1
+    assert "/srv/one:/srv/one:rw" in first
+    assert "/srv/two:/srv/two:rw" in second
+    assert first[first.index("-w") + 1] == "/srv/one"
+    assert second[second.index(config.image) - 1] == "/srv/two"
+
+
+def test_validate_docker_available_caches_success():
+    """A successful check is reused; docker info runs only once."""
+    with patch("subprocess.run") as mock_run:
+        mock_run.return_value = MagicMock(returncode=0)
+        from nightwire.sandbox import validate_docker_available
+        assert validate_docker_available() == (True, "")
+        assert validate_docker_available() == (True, "")
+        assert mock_run.call_count == 1
+
+        reset_docker_check()
+        validate_docker_available()
+        assert mock_run.call_count == 2
+
+
+def test_validate_docker_available_success_expires_after_ttl():
+    """A cached success is re-checked once its TTL has passed."""
+    with patch("subprocess.run") as mock_run, \
+            patch("nightwire.sandbox.time.monotonic") as mock_clock:
+        mock_run.return_value = MagicMock(returncode=0)
+        from nightwire.sandbox import validate_docker_available
+        mock_clock.return_value = 1000.0
+        validate_docker_available()
+        mock_clock.return_value = 1059.0
+        validate_docker_available()
+        assert mock_run.call_count == 1
+        mock_clock.return_value = 1061.0
+        validate_docker_available()
+        assert mock_run.call_count == 2
+
+
+def test_validate_docker_available_caches_failure_briefly():
+    """A failed check is reused for a few seconds, then retried."""
+    with patch("subprocess.run") as mock_run, \
+            patch("nightwire.sandbox.time.monotonic") as mock_clock:
+        mock_run.return_value = MagicMock(returncode=1)
+        from nightwire.sandbox import validate_docker_available
+        mock_clock.return_value = 1000.0
+        assert validate_docker_available()[0] is False
+        mock_run.return_value = MagicMock(returncode=0)
+        mock_clock.return_value = 1004.0
+        assert validate_docker_available()[0] is False
+        assert mock_run.call_count == 1
+        mock_clock.return_value = 1006.0
+        assert validate_docker_available()[0] is True
+        assert mock_run.call_count == 2
@@ -45,6 +45,19 @@ def test_require_valid_project_path_works_with_path_kwarg():
         assert result == "ok"
 
 
+def test_require_valid_project_path_finds_path_after_self():
+    """On methods, the 'path' parameter is validated rather than self."""
+    class Runner:
+        @require_valid_project_path
+        def run(self, path: str):
+            return f"ran:{path}"
+
+    with patch("nightwire.security.validate_project_path") as mock_validate:
+        mock_validate.return_value = Path("/valid")
+        assert Runner().run("/valid") == "ran:/valid"
+        mock_validate.assert_called_once_with("/valid")
+
+
 def test_claude_runner_set_project_validates_path():
     """ClaudeRunner.set_project should reject invalid paths."""
     with patch("nightwire.security.validate_project_path") as mock_validate:
@@ -76,6 +89,26 @@ async def test_rate_limiter_thread_safety():
     await check_many()
 
 
+@pytest.mark.asyncio
+async def test_rate_limiter_concurrent_checks_keep_per_sender_counts():
+    """Concurrent checks for many senders are counted exactly per sender."""
+    from nightwire.security import (
+        RATE_LIMIT_MAX_REQUESTS, check_rate_limit_async, _reset_rate_limits,
+    )
+
+    _reset_rate_limits()
+    senders = [f"+1555100{i:04d}" for i in range(100)]
+    results = await asyncio.gather(*(
+        check_rate_limit_async(sender)
+        for sender in senders
+        for _ in range(RATE_LIMIT_MAX_REQUESTS + 1)
+    ))
+
+    assert results.count("allowed") == len(senders) * RATE_LIMIT_MAX_REQUESTS
+    assert results.count("limited_notify") == len(senders)
+    _reset_rate_limits()
+
+
 # --- validate_project_path tests ---
 
 def test_validate_project_path_allows_base_path():
@@ -3,144 +3,183 @@
 import asyncio
 import re
 import subprocess
+import sys
+import threading
+import time
 
 import pytest
-from unittest.mock import patch, MagicMock, AsyncMock
+from unittest.mock import patch, MagicMock
 from pathlib import Path
 
+from nightwire.config import Config
+from nightwire.updater import AutoUpdater
 
-class TestAutoUpdateConfig:
-    """Tests for auto_update configuration properties."""
 
-    def test_auto_update_disabled_by_default(self):
-        from nightwire.config import Config
-        with patch.object(Config, '__init__', lambda self, **kw: None):
-            config = Config.__new__(Config)
-            config.settings = {}
-            assert config.auto_update_enabled is False
-
-    def test_auto_update_enabled_from_settings(self):
-        from nightwire.config import Config
-        with patch.object(Config, '__init__', lambda self, **kw: None):
-            config = Config.__new__(Config)
-            config.settings = {"auto_update": {"enabled": True}}
-            assert config.auto_update_enabled is True
-
-    def test_auto_update_check_interval_default(self):
-        from nightwire.config import Config
-        with patch.object(Config, '__init__', lambda self, **kw: None):
-            config = Config.__new__(Config)
-            config.settings = {}
-            assert config.auto_update_check_interval == 21600
-
-    def test_auto_update_check_interval_from_settings(self):
-        from nightwire.config import Config
-        with patch.object(Config, '__init__', lambda self, **kw: None):
-            config = Config.__new__(Config)
-            config.settings = {"auto_update": {"check_interval": 3600}}
-            assert config.auto_update_check_interval == 3600
-
-    def test_auto_update_branch_default(self):
-        from nightwire.config import Config
-        with patch.object(Config, '__init__', lambda self, **kw: None):
-            config = Config.__new__(Config)
-            config.settings = {}
-            assert config.auto_update_branch == "main"
-
-    def test_auto_update_branch_from_settings(self):
-        from nightwire.config import Config
-        with patch.object(Config, '__init__', lambda self, **kw: None):
-            config = Config.__new__(Config)
-            config.settings = {"auto_update": {"branch": "develop"}}
-            assert config.auto_update_branch == "develop"
+class AsyncRecorder:
+    """Minimal async callable that records its calls."""
 
+    def __init__(self):
+        self.calls = []
 
-class TestAutoUpdater:
-    """Tests for AutoUpdater class."""
+    async def __call__(self, *args, **kwargs):
+        self.calls.append((args, kwargs))
+
+
+@pytest.fixture
+def make_config():
+    """Build a Config from a settings dict without running Config.__init__."""
+    def _make_config(settings):
+        config = Config.__new__(Config)
+        config.settings = settings
+        return config
+    return _make_config
 
-    def _make_updater(self, send_message=None, branch="main"):
-        """Create an AutoUpdater with mocked dependencies."""
-        from nightwire.updater import AutoUpdater
+
+@pytest.fixture
+def make_updater():
+    """Build an AutoUpdater with mocked dependencies."""
+    def _make_updater(send_message=None, branch="main"):
         config = MagicMock()
         config.auto_update_enabled = True
         config.auto_update_check_interval = 21600
         config.auto_update_branch = branch
         config.allowed_numbers = ["+15551234567"]
         if send_message is None:
-            send_message = AsyncMock()
+            send_message = AsyncRecorder()
         return AutoUpdater(
             config=config,
             send_message=send_message,
             repo_dir=Path("/fake/repo"),
         )
+    return _make_updater
+
+
+class TestAutoUpdateConfig:
+    """Tests for auto_update configuration properties."""
+
+    @pytest.mark.parametrize("settings,attr,expected", [
+        ({}, "auto_update_enabled", False),
+        ({"auto_update": {"enabled": True}}, "auto_update_enabled", True),
+        ({}, "auto_update_check_interval", 21600),
+        ({"auto_update": {"check_interval": 3600}}, "auto_update_check_interval", 3600),
+        ({}, "auto_update_branch", "main"),
+        ({"auto_update": {"branch": "develop"}}, "auto_update_branch", "develop"),
+    ])
+    def test_property(self, make_config, settings, attr, expected):
+        assert getattr(make_config(settings), attr) == expected
+
+
+class TestAutoUpdater:
+    """Tests for AutoUpdater class."""
 
     # --- check_for_updates tests ---
 
     @pytest.mark.asyncio
-    async def test_check_for_updates_no_update(self):
+    async def test_check_for_updates_no_update(self, make_updater):
         """check_for_updates returns False when local matches remote."""
-        updater = self._make_updater()
+        updater = make_updater()
         async def fake_run_git(*args, **kwargs):
-            return "abc1234"
+            if args[0] == "rev-parse":
+                return "abc1234\nabc1234"
+            return ""
         updater._run_git = fake_run_git
         result = await updater.check_for_updates()
         assert result is False
         assert updater.pending_update is False
 
     @pytest.mark.asyncio
-    async def test_check_for_updates_has_update(self):
+    async def test_check_for_updates_has_update(self, make_updater):
         """check_for_updates returns True and sets pending state when remote is ahead."""
-        send = AsyncMock()
-        updater = self._make_updater(send_message=send)
-        call_count = 0
+        send = AsyncRecorder()
+        updater = make_updater(send_message=send)
+        git_outputs = {
+            ("fetch", "origin", "main"): "",
+            ("rev-parse", "HEAD", "origin/main"): "abc1234\ndef5678",  # local, remote
+            ("rev-list", "--count", "HEAD..origin/main"): "3",
+            ("log", "--format=%s", "-1", "origin/main"): "feat: add cool thing",
+        }
         async def fake_run_git(*args, **kwargs):
-            nonlocal call_count
-            call_count += 1
-            if call_count == 1:
-                return ""  # git fetch
-            elif call_count == 2:
-                return "abc1234"  # local HEAD
-            elif call_count == 3:
-                return "def5678"  # remote HEAD
-            elif call_count == 4:
-                return "3"  # commit count
-            elif call_count == 5:
-                return "feat: add cool thing"  # latest commit message
-            return ""
+            return git_outputs[args]
         updater._run_git = fake_run_git
         result = await updater.check_for_updates()
         assert result is True
         assert updater.pending_update is True
         assert updater.pending_sha == "def5678"
-        send.assert_called_once()
+        assert len(send.calls) == 1
 
     @pytest.mark.asyncio
-    async def test_check_for_updates_no_renotify_same_sha(self):
+    async def test_check_for_updates_no_renotify_same_sha(self, make_updater):
         """check_for_updates should not re-notify if pending_sha unchanged."""
-        send = AsyncMock()
-        updater = self._make_updater(send_message=send)
+        send = AsyncRecorder()
+        updater = make_updater(send_message=send)
         updater.pending_update = True
         updater.pending_sha = "def5678"
-        call_count = 0
+        git_outputs = {
+            ("fetch", "origin", "main"): "",
+            # local HEAD, remote HEAD (same as pending)
+            ("rev-parse", "HEAD", "origin/main"): "abc1234\ndef5678",
+        }
         async def fake_run_git(*args, **kwargs):
-            nonlocal call_count
-            call_count += 1
-            if call_count == 1:
-                return ""  # git fetch
-            elif call_count == 2:
-                return "abc1234"  # local HEAD
-            elif call_count == 3:
-                return "def5678"  # remote HEAD (same as pending)
-            return ""
+            return git_outputs[args]
+        updater._run_git = fake_run_git
+        result = await updater.check_for_updates()
+        assert result is True
+        assert not send.calls
+
+    @pytest.mark.asyncio
+    async def test_check_for_updates_uses_cache_when_pending(self, make_updater):
+        """A pending update from a recent fetch is reported without running git."""
+        updater = make_updater()
+        updater.pending_update = True
+        updater.pending_sha = "def5678"
+        updater._last_fetch_ts = time.monotonic()
+        async def fake_run_git(*args, **kwargs):
+            raise AssertionError(f"unexpected git call: {args}")
         updater._run_git = fake_run_git
         result = await updater.check_for_updates()
         assert result is True
-        send.assert_not_called()
 
     @pytest.mark.asyncio
-    async def test_check_for_updates_git_fetch_fails(self):
+    async def test_check_for_updates_reads_refs_with_pygit2(self, make_updater):
+        """With pygit2 available, only the fetch spawns git."""
+        repo = MagicMock()
+        repo.head.target = "abc1234"
+        repo.references = {
+            "refs/remotes/origin/main": MagicMock(**{"resolve.return_value.target": "def5678"}),
+        }
+        walk_threads = []
+        def ahead_behind(remote, local):
+            walk_threads.append(threading.get_ident())
+            return 3, 0
+        repo.ahead_behind.side_effect = ahead_behind
+        repo.__getitem__.return_value.message = "feat: add cool thing\n\nDetails.\n"
+        fake_pygit2 = MagicMock(**{"Repository.return_value": repo})
+
+        send = AsyncRecorder()
+        updater = make_updater(send_message=send)
+        git_calls = []
+        async def fake_run_git(*args, **kwargs):
+            git_calls.append(args)
+            return ""
+        updater._run_git = fake_run_git
+
+        with patch.dict(sys.modules, {"pygit2": fake_pygit2}):
+            result = await updater.check_for_updates()
+
+        assert result is True
+        assert git_calls == [("fetch", "origin", "main")]
+        repo.ahead_behind.assert_called_once_with("def5678", "abc1234")
+        # History walk runs in a worker thread, not on the event loop
+        assert walk_threads != [threading.get_ident()]
+        assert updater.pending_sha == "def5678"
+        (_, msg), _ = send.calls[0]
+        assert "3 new commit(s)" in msg
+        assert "'feat: add cool thing'" in msg
+
+    @pytest.mark.asyncio
+    async def test_check_for_updates_git_fetch_fails(self, make_updater):
         """check_for_updates returns False on git fetch failure (e.g. network down)."""
-        updater = self._make_updater()
+        updater = make_updater()
         async def fake_run_git(*args, **kwargs):
             raise subprocess.CalledProcessError(1, ["git", "fetch"], "", "network error")
         updater._run_git = fake_run_git
@@ -150,17 +189,17 @@ class TestAutoUpdater:
     # --- apply_update tests ---
 
     @pytest.mark.asyncio
-    async def test_apply_update_no_pending(self):
+    async def test_apply_update_no_pending(self, make_updater):
         """apply_update returns message when no update pending."""
-        updater = self._make_updater()
+        updater = make_updater()
         result = await updater.apply_update()
         assert result == "No updates available."
 
     @pytest.mark.asyncio
-    async def test_apply_update_success_fallback(self):
+    async def test_apply_update_success_fallback(self, make_updater):
         """apply_update uses call_later to schedule exit when no shutdown_callback."""
-        send = AsyncMock()
-        updater = self._make_updater(send_message=send)
+        send = AsyncRecorder()
+        updater = make_updater(send_message=send)
         updater.pending_update = True
         updater.pending_sha = "def5678"
 
@@ -186,11 +225,11 @@ class TestAutoUpdater:
         assert args[2] == 75  # EXIT_CODE_UPDATE
 
     @pytest.mark.asyncio
-    async def test_apply_update_success_with_shutdown_callback(self):
+    async def test_apply_update_success_with_shutdown_callback(self, make_updater):
         """apply_update calls shutdown_callback instead of _delayed_exit when provided."""
-        send = AsyncMock()
+        send = AsyncRecorder()
         shutdown_cb = MagicMock()
-        updater = self._make_updater(send_message=send)
+        updater = make_updater(send_message=send)
         updater._shutdown_callback = shutdown_cb
         updater.pending_update = True
         updater.pending_sha = "def5678"
@@ -210,10 +249,10 @@ class TestAutoUpdater:
         shutdown_cb.assert_called_once()  # Graceful shutdown triggered
 
     @pytest.mark.asyncio
-    async def test_apply_update_git_pull_fails_triggers_rollback(self):
+    async def test_apply_update_git_pull_fails_triggers_rollback(self, make_updater):
         """apply_update rolls back and resets state on git pull failure."""
-        send = AsyncMock()
-        updater = self._make_updater(send_message=send)
+        send = AsyncRecorder()
+        updater = make_updater(send_message=send)
         updater.pending_update = True
         updater.pending_sha = "def5678"
 
@@ -226,42 +265,42 @@ class TestAutoUpdater:
             # git pull fails
             raise subprocess.CalledProcessError(1, ["git", "pull"], "", "merge conflict")
         updater._run_git = fake_run_git
-        updater._rollback = AsyncMock()
+        updater._rollback = AsyncRecorder()
 
         result = await updater.apply_update()
         assert "failed" in result.lower()
-        updater._rollback.assert_called_once_with("abc1234")
+        assert updater._rollback.calls == [(("abc1234",), {})]
         assert updater.pending_update is False  # State reset for re-check
         assert updater.pending_sha is None
-        send.assert_called()
+        assert send.calls
 
     @pytest.mark.asyncio
-    async def test_apply_update_pip_fails_triggers_rollback(self):
+    async def test_apply_update_pip_fails_triggers_rollback(self, make_updater):
         """apply_update rolls back on pip install failure."""
-        send = AsyncMock()
-        updater = self._make_updater(send_message=send)
+        send = AsyncRecorder()
+        updater = make_updater(send_message=send)
         updater.pending_update = True
         updater.pending_sha = "def5678"
 
         async def fake_run_git(*args, **kwargs):
             return "abc1234"
         updater._run_git = fake_run_git
-        updater._rollback = AsyncMock()
+        updater._rollback = AsyncRecorder()
 
         with patch("nightwire.updater.subprocess.run") as mock_run:
             mock_run.return_value = MagicMock(returncode=1, stderr="error", stdout="")
             result = await updater.apply_update()
 
         assert "rolled back" in result.lower()
-        updater._rollback.assert_called_once_with("abc1234")
+        assert updater._rollback.calls == [(("abc1234",), {})]
         assert updater.pending_update is False
         assert updater.pending_sha is None
 
     @pytest.mark.asyncio
-    async def test_apply_update_timeout_triggers_rollback(self):
+    async def test_apply_update_timeout_triggers_rollback(self, make_updater):
         """apply_update handles subprocess timeout and rolls back."""
-        send = AsyncMock()
-        updater = self._make_updater(send_message=send)
+        send = AsyncRecorder()
+        updater = make_updater(send_message=send)
         updater.pending_update = True
         updater.pending_sha = "def5678"
 
@@ -275,22 +314,22 @@ class TestAutoUpdater:
                 return ""  # git pull succeeds
             return ""
         updater._run_git = fake_run_git
-        updater._rollback = AsyncMock()
+        updater._rollback = AsyncRecorder()
 
         with patch("nightwire.updater.subprocess.run") as mock_run:
             mock_run.side_effect = subprocess.TimeoutExpired(["pip"], 120)
             result = await updater.apply_update()
 
         assert "failed" in result.lower()
-        updater._rollback.assert_called_once_with("abc1234")
+        assert updater._rollback.calls == [(("abc1234",), {})]
         assert updater.pending_update is False
 
     # --- lifecycle tests ---
 
     @pytest.mark.asyncio
-    async def test_start_stop_lifecycle(self):
+    async def test_start_stop_lifecycle(self, make_updater):
         """start() creates task, stop() cancels it."""
-        updater = self._make_updater()
+        updater = make_updater()
         await updater.start()
         assert updater._check_task is not None
         assert not updater._check_task.done()
@@ -298,9 +337,9 @@ class TestAutoUpdater:
         assert updater._check_task.done()
 
     @pytest.mark.asyncio
-    async def test_start_without_admin_phone(self):
+    async def test_start_without_admin_phone(self, make_updater):
         """start() warns and does not create task if no admin phone."""
-        updater = self._make_updater()
+        updater = make_updater()
         updater.admin_phone = None
         await updater.start()
         assert updater._check_task is None
@@ -309,34 +348,32 @@ class TestAutoUpdater:
 
     def test_rejects_branch_starting_with_dash(self):
         """Branch names starting with - are rejected (git flag injection)."""
-        from nightwire.updater import AutoUpdater
         config = MagicMock()
         config.auto_update_branch = "--upload-pack=evil"
         config.allowed_numbers = ["+15551234567"]
         config.auto_update_check_interval = 21600
         with pytest.raises(ValueError, match="Invalid branch name"):
-            AutoUpdater(config=config, send_message=AsyncMock(),
+            AutoUpdater(config=config, send_message=AsyncRecorder(),
                         repo_dir=Path("/fake/repo"))
 
     def test_accepts_valid_branch_names(self):
         """Valid branch names like feature/foo and release-1.0 are accepted."""
-        from nightwire.updater import AutoUpdater
         for branch in ["main", "develop", "feature/auto-update", "release-1.0",
                         "v2.0.0", "my_branch"]:
             config = MagicMock()
             config.auto_update_branch = branch
             config.allowed_numbers = ["+15551234567"]
             config.auto_update_check_interval = 21600
-            updater = AutoUpdater(config=config, send_message=AsyncMock(),
+            updater = AutoUpdater(config=config, send_message=AsyncRecorder(),
                                   repo_dir=Path("/fake/repo"))
             assert updater.branch == branch
 
     # --- rollback tests ---
 
     @pytest.mark.asyncio
-    async def test_rollback_failure_does_not_crash(self):
+    async def test_rollback_failure_does_not_crash(self, make_updater):
         """_rollback logs error but does not raise on git reset failure."""
-        updater = self._make_updater()
+        updater = make_updater()
         async def failing_git(*args, **kwargs):
             raise subprocess.CalledProcessError(1, ["git", "reset"], "", "error")
         updater._run_git = failing_git
@@ -346,9 +383,9 @@ class TestAutoUpdater:
     # --- check loop error handling ---
 
     @pytest.mark.asyncio
-    async def test_check_loop_continues_after_error(self):
+    async def test_check_loop_continues_after_error(self, make_updater):
         """_check_loop should continue running after check_for_updates raises."""
-        updater = self._make_updater()
+        updater = make_updater()
         updater.check_interval = 0.01  # Fast for testing
         call_count = 0
 